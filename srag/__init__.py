@@ -1,4 +1,5 @@
 from .document import ElasticSearchIndexer, QdrantIndexer
+from .llm.cache import SemanticCache
 from .pipeline.pipeline import (
     BasePipeline,
     BaseTransform,
@@ -17,6 +18,7 @@ from .pipeline.vanilla import (
 __all__ = [
     "QdrantIndexer",
     "SharedResource",
+    "SemanticCache",
     "ElasticSearchIndexer",
     "build_vanilla_pipeline",
     "BaseTransform",
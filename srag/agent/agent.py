@@ -1,9 +1,69 @@
+import functools
+from dataclasses import dataclass
+from string import Formatter
+
 from srag.pipeline import TransformListener
 from srag.pipeline.vanilla import Generation
 
 from ..pipeline import BaseTransform
 
 
+def _escape(text: str) -> str:
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def _split_static_prefix(template: str) -> tuple[str, str]:
+    """Split a format template at its first replacement field.
+
+    Returns the static prefix as plain text and the rest as a format template.
+    """
+    prefix, suffix = "", None
+    for literal, field_name, format_spec, conversion in Formatter().parse(template):
+        if suffix is None:
+            prefix += literal
+            if field_name is None:
+                continue
+            suffix = []
+        else:
+            suffix.append(_escape(literal))
+        if field_name is not None:
+            conversion = f"!{conversion}" if conversion else ""
+            format_spec = f":{format_spec}" if format_spec else ""
+            suffix.append(f"{{{field_name}{conversion}{format_spec}}}")
+    if suffix is None:
+        return "", template
+    return prefix, "".join(suffix)
+
+
+def _field_names(template: str) -> frozenset[str]:
+    return frozenset(
+        field_name.split(".", 1)[0].split("[", 1)[0]
+        for _, field_name, _, _ in Formatter().parse(template)
+        if field_name
+    )
+
+
+class _StateView(dict):
+    """absent keys format as empty strings"""
+
+    def __missing__(self, key):
+        return ""
+
+
+@dataclass(frozen=True)
+class _PromptTemplate:
+    text: str
+    keys: frozenset[str]
+    static_prefix: str
+    dynamic_suffix: str
+
+
+def _prompt_text(prompt: str | list[dict]) -> str:
+    if isinstance(prompt, str):
+        return prompt
+    return "\n".join(message["content"] for message in prompt)
+
+
 class Agent(BaseTransform):
     def __init__(
         self,
@@ -32,15 +92,46 @@ class PromptAgent(Agent):
         input_key: list[str],
         output_key: list[str],
         *args,
+        cache_prompt_prefix: bool = False,
         **kwargs,
     ):
         super().__init__(input_key=input_key, output_key=output_key, *args, **kwargs)
         self.genration = Generation(llm_model=llm_model)
-        self.prompt = "\n".join([x.strip() for x in self.__doc__.split("\n")])
+        template = type(self)._get_template()
+        self.prompt = template.text
+        self.prompt_keys = template.keys
+        missing = self.prompt_keys.difference(
+            [input_key] if isinstance(input_key, str) else input_key
+        )
+        if missing:
+            raise ValueError(
+                f"Prompt of {self.name} uses keys {sorted(missing)} not in input_key {input_key}"
+            )
+        self._static_prefix = template.static_prefix
+        self._dynamic_suffix = template.dynamic_suffix
+        # send the static part of the template as a cacheable system message
+        self.cache_prompt_prefix = cache_prompt_prefix and bool(self._static_prefix.strip())
+
+    @classmethod
+    @functools.cache
+    def _get_template(cls) -> _PromptTemplate:
+        """Parse the class docstring into a prompt template, once per class"""
+        text = "\n".join([x.strip() for x in (cls.__doc__ or "").split("\n")])
+        static_prefix, dynamic_suffix = _split_static_prefix(text)
+        return _PromptTemplate(text, _field_names(text), static_prefix, dynamic_suffix)
 
     async def form_prompt(self, inputs: dict):
-        format_dict = {key: inputs.get(key) for key in self.input_key}
-        return self.prompt.format(**format_dict)
+        values = _StateView(inputs)
+        if not self.cache_prompt_prefix:
+            return self.prompt.format_map(values)
+        return [
+            {
+                "role": "system",
+                "content": self._static_prefix,
+                "cache_control": {"type": "ephemeral"},
+            },
+            {"role": "user", "content": self._dynamic_suffix.format_map(values)},
+        ]
 
     async def parse_response(self, response: str):
         raise NotImplementedError
@@ -48,7 +139,19 @@ class PromptAgent(Agent):
     async def transform(self, state, **kwargs):
         final_prompt = await self.form_prompt(state)
         state["final_prompt"] = final_prompt
-        state = await self.genration(state)
+        cache = self.shared.semantic_cache
+        if cache is None:
+            state = await self.genration(state)
+        else:
+            # agents sharing the cache must not get each other's responses
+            namespace = (type(self), self.genration.llm_model)
+            embedding = await cache.embed(_prompt_text(final_prompt))
+            response = cache.search(embedding, namespace=namespace)
+            if response is not None:
+                state["response"] = response
+            else:
+                state = await self.genration(state)
+                cache.add(embedding, state["response"], namespace=namespace)
         output = await self.parse_response(state["response"])
         state["parsed_response"] = output
         return state
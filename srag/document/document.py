@@ -1,5 +1,6 @@
 import uuid
-from typing import Literal, Union
+from types import MappingProxyType
+from typing import Iterator, Literal, Union
 
 import pydantic
 
@@ -7,11 +8,43 @@ from srag.utils import get_current_time_formatted
 
 from .._base import BaseModel
 
-
-class Document(BaseModel):
+_DOCUMENT_INDEX_SCHEMAS = MappingProxyType(
+    {
+        "id": "uuid",
+        "description": "text",
+        "created_at": "datetime",
+        "updated_at": "datetime",
+    }
+)
+
+_CHUNK_INDEX_SCHEMAS = MappingProxyType(
+    {
+        "id": "uuid",
+        "parent_chunk_id": "uuid",
+        "doc_id": "uuid",
+        "chunk_type": "keyword",
+        "content": MappingProxyType({"type": "text", "tokenizer": "multilingual"}),
+        "created_at": "datetime",
+        "updated_at": "datetime",
+    }
+)
+
+
+class _TimestampedModel(BaseModel):
+    @pydantic.model_validator(mode="before")
+    @classmethod
+    def share_creation_timestamp(cls, data):
+        """Fill `created_at`/`updated_at` from a single clock read"""
+        if isinstance(data, dict) and ("created_at" not in data or "updated_at" not in data):
+            now = get_current_time_formatted()
+            data = {"created_at": now, "updated_at": now, **data}
+        return data
+
+
+class Document(_TimestampedModel):
     """document 由多个 chunk 组成"""
 
-    id: str = pydantic.Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = pydantic.Field(default_factory=lambda: uuid.uuid4().hex)
     """UUID"""
     source: str | None = None
     description: str | None = None
@@ -26,29 +59,30 @@ class Document(BaseModel):
     chunks: list["Chunk"] = []
 
     def get_index_fieldname_schemas(self):
-        return {
-            "id": "uuid",
-            "description": "text",
-            "created_at": "datetime",
-            "updated_at": "datetime",
-        }
+        """read-only, copy before modifying"""
+        return _DOCUMENT_INDEX_SCHEMAS
 
-    def get_chunks(self) -> list["Chunk"]:
-        flatten_chunks = []
+    def iter_chunks(self) -> Iterator["Chunk"]:
+        """Iterate leaf chunks, children replace their parent chunk"""
         for chunk in self.chunks:
-            if chunk.children:
-                flatten_chunks.extend(chunk.children)
-            else:
-                flatten_chunks.append(chunk)
-        return flatten_chunks
+            yield from chunk.children or (chunk,)
+
+    def get_chunks(self) -> list["Chunk"]:
+        return list(self.iter_chunks())
 
     def add_chunk(self, chunk: Union["Chunk", list["Chunk"]]):
-        if isinstance(chunk, list):
-            self.chunks.extend(chunk)
-        else:
-            self.chunks.append(chunk)
+        new_chunks = chunk if isinstance(chunk, list) else [chunk]
+        if self.child_chunk_ids is None or len(self.child_chunk_ids) != len(self.chunks):
+            # chunks were assigned without going through add_chunk
+            self.rebuild_child_ids()
+        self.chunks.extend(new_chunks)
+        self.child_chunk_ids.extend(c.id for c in new_chunks)
         self.num_chunks = len(self.chunks)
+
+    def rebuild_child_ids(self):
+        """Resync `child_chunk_ids` and `num_chunks` after mutating `chunks` directly"""
         self.child_chunk_ids = [c.id for c in self.chunks]
+        self.num_chunks = len(self.chunks)
 
     def clear_chunks(self):
         self.chunks = []
@@ -56,10 +90,10 @@ class Document(BaseModel):
         self.child_chunk_ids = []
 
 
-class Chunk(BaseModel):
+class Chunk(_TimestampedModel):
     """chunk 由多个 token 组成"""
 
-    id: str = pydantic.Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = pydantic.Field(default_factory=lambda: uuid.uuid4().hex)
     """chunk UUID"""
     index: int | None = None
     """index of the chunk in the document"""
@@ -104,18 +138,12 @@ class Chunk(BaseModel):
     metadata: dict | None = None
     """Othre metadata"""
 
-    children: list["Chunk"] = []
+    children: list["Chunk"] | None = None
+    """sub-chunks, None for leaf chunks"""
 
     def get_index_fieldname_schemas(self):
-        return {
-            "id": "uuid",
-            "parent_chunk_id": "uuid",
-            "doc_id": "uuid",
-            "chunk_type": "keyword",
-            "content": {"type": "text", "tokenizer": "multilingual"},
-            "created_at": "datetime",
-            "updated_at": "datetime",
-        }
+        """read-only, copy before modifying"""
+        return _CHUNK_INDEX_SCHEMAS
 
     def get_content_to_embed(self):
         return self.content
@@ -1,25 +1,152 @@
 import os
+import time
+from contextlib import asynccontextmanager
 
-from elasticsearch import AsyncElasticsearch
+import anyio
+from elasticsearch import AsyncElasticsearch, BadRequestError
+from elasticsearch.helpers import async_streaming_bulk
 
+from srag import exceptions
 from srag.document import Document
 
 from ._base import BaseIndexer
 
+_BULK_LOAD_SETTINGS = {"refresh_interval": "-1", "number_of_replicas": 0}
+
 
 class ElasticSearchIndexer(BaseIndexer):
     def __init__(
         self,
         host: str | None = None,
         api_key: str | None = None,
+        *,
+        batch_size: int = 500,
+        parallel: int = 4,
+        doc_metadata_index: str = "doc_metadata",
+        default_index_name: str = "documents",
     ):
         self.es = AsyncElasticsearch(
             hosts=host or os.getenv("ELASTIC_SEARCH_HOST"),
             api_key=api_key or os.getenv("ELASTIC_SEARCH_API_KEY"),
         )
+        self.batch_size = batch_size
+        self.parallel = parallel
+        self.doc_metadata_index = doc_metadata_index
+        self.default_index_name = default_index_name
+        self._bulk_loads: dict[str, dict] = {}
+
+    async def _ensure_index(self, index_name: str):
+        if await self.es.indices.exists(index=index_name):
+            return
+        try:
+            await self.es.indices.create(index=index_name)
+        except BadRequestError as e:
+            # a concurrent call created it first
+            if e.error != "resource_already_exists_exception":
+                raise
+
+    async def _get_bulk_changes(self, index_name: str) -> dict:
+        """Original values of the bulk settings the index does not already have"""
+        resp = await self.es.indices.get_settings(
+            index=index_name,
+            name=[f"index.{key}" for key in _BULK_LOAD_SETTINGS],
+            flat_settings=True,
+        )
+        current = resp.get(index_name, {}).get("settings", {})
+        changes = {}
+        for key, bulk_value in _BULK_LOAD_SETTINGS.items():
+            value = current.get(f"index.{key}")
+            # keys already at the bulk value are configured that way or held by another
+            # load, they are neither changed nor restored. unset values restore as None
+            if str(value) != str(bulk_value):
+                changes[key] = value
+        return changes
+
+    @asynccontextmanager
+    async def bulk_load(self, index_name: str | None = None):
+        """Speed up indexing many documents into one index.
+
+        Refresh and replicas are disabled for the whole block and restored when the
+        last concurrent block of this indexer ends, then the index is refreshed.
+
+            async with indexer.bulk_load("documents"):
+                for doc in docs:
+                    await indexer.index(doc, "documents")
+        """
+        index_name = index_name or self.default_index_name
+        load = self._bulk_loads.setdefault(index_name, {"count": 0, "originals": {}})
+        load["count"] += 1
+        try:
+            if load["count"] == 1:
+                await self._ensure_index(index_name)
+                load["originals"] = await self._get_bulk_changes(index_name)
+                if load["originals"]:
+                    await self.es.indices.put_settings(
+                        index=index_name,
+                        settings={key: _BULK_LOAD_SETTINGS[key] for key in load["originals"]},
+                    )
+            yield
+        finally:
+            load["count"] -= 1
+            if load["count"] == 0:
+                del self._bulk_loads[index_name]
+                if load["originals"]:
+                    await self.es.indices.put_settings(index=index_name, settings=load["originals"])
+                await self.es.indices.refresh(index=index_name)
+
+    async def _bulk_worker(self, actions, errors: list):
+        try:
+            async for ok, item in async_streaming_bulk(
+                self.es,
+                actions,
+                chunk_size=self.batch_size,
+                raise_on_error=False,
+                yield_ok=False,
+            ):
+                if not ok:
+                    errors.append(item)
+        except Exception as e:
+            # transport errors abort this worker, `index` reports them with the item errors
+            errors.append({"exception": repr(e)})
 
     async def index(self, doc: Document, index_name: str | None = None):
-        return await super().index(doc, index_name)
+        """Bulk index the document's chunks, then store the document metadata.
+
+        Wrap indexing many documents in `bulk_load` to pause refreshes meanwhile.
+
+        Args:
+            doc (Document): Document to index
+        """
+        index_name = index_name or self.default_index_name
+        doc.index_name = index_name
+        doc.index_time = time.time()
+        if not doc.chunks:
+            return
+
+        await self._ensure_index(index_name)
+        # workers pull from one generator, each action is sent exactly once
+        actions = (
+            {
+                "_index": index_name,
+                "_id": chunk.id,
+                "_source": chunk.model_dump(exclude=["children"], exclude_none=True),
+            }
+            for chunk in doc.iter_chunks()
+        )
+        errors = []
+        async with anyio.create_task_group() as tg:
+            for _ in range(self.parallel):
+                tg.start_soon(self._bulk_worker, actions, errors)
+        if errors:
+            raise exceptions.IndexUploadException(
+                f"Failed to index chunks for document {doc.id}: {len(errors)} errors",
+                context={"errors": errors},
+            )
+        await self.es.index(
+            index=self.doc_metadata_index,
+            id=doc.id,
+            document=doc.model_dump(exclude=["chunks"], exclude_none=True),
+        )
 
     async def list_index(self):
         """list all indexes"""
@@ -9,6 +9,7 @@ from qdrant_client.http import models
 
 from srag import exceptions
 from srag.document import Chunk, Document
+from srag.utils import batched
 
 from ..retriever._base import BaseRetriever
 from ._base import BaseIndexer
@@ -106,7 +107,8 @@ class QdrantRetriever(BaseRetriever):
         )
         chunks = []
         for point in query_resp.points:
-            chunk = Document.model_validate(point.payload)
+            # payloads are written by `QdrantIndexer`, skip re-validation
+            chunk = Chunk.model_construct(**point.payload)
             chunk.score = point.score
             chunks.append(chunk)
         return chunks
@@ -123,6 +125,7 @@ class QdrantIndexer(BaseIndexer):
         use_sparse: bool = False,
         use_full_text: bool = True,
         batch_size: int = 64,
+        embed_batch_size: int = 256,
         parallel: int = 1,
         distance_type: Literal["cosine", "euclidean", "dot", "manhattan"] = "cosine",
         doc_metadata_collection: str = "doc_metadata",
@@ -141,6 +144,7 @@ class QdrantIndexer(BaseIndexer):
         self.use_sparse = use_sparse
         self.use_full_text = use_full_text
         self.batch_size = batch_size
+        self.embed_batch_size = embed_batch_size
         self.parallel = parallel
         self.client = client or AsyncModelhub()
         self.doc_metadata_collection = doc_metadata_collection
@@ -178,13 +182,15 @@ class QdrantIndexer(BaseIndexer):
                     field_name=field,
                     field_schema=schema,
                 )
+
+    def _upload_doc_metadata(self, doc: Document):
         self.qdrant.upload_points(
             collection_name=self.doc_metadata_collection,
             points=[
                 models.PointStruct(
                     id=doc.id,
                     vector=[0],
-                    payload=doc.model_dump(exclude=["chunks"]),
+                    payload=doc.model_dump(exclude=["chunks"], exclude_none=True),
                 )
             ],
         )
@@ -221,7 +227,7 @@ class QdrantIndexer(BaseIndexer):
             point = models.PointStruct(
                 id=chunk.id,
                 vector=vector,
-                payload=chunk.model_dump(exclude=["children"]),
+                payload=chunk.model_dump(exclude=["children"], exclude_none=True),
             )
             points.append(point)
         return points
@@ -269,26 +275,36 @@ class QdrantIndexer(BaseIndexer):
         Args:
             doc (Document): Document to index
         """
-        chunks = doc.get_chunks()
-        if not chunks:
-            return
-
-        chunks_content = [chunk.content for chunk in chunks]
-        embed = await self._get_embeddings(chunks_content)
-        points = await self._embed_chunks(chunks, embed)
+        index_checked = False
+        # embed and upload `embed_batch_size` chunks at a time
+        for chunks in batched(doc.iter_chunks(), self.embed_batch_size):
+            chunks_content = [chunk.content for chunk in chunks]
+            embed = await self._get_embeddings(chunks_content)
+            points = await self._embed_chunks(chunks, embed)
 
+            try:
+                if not index_checked:
+                    await self._check_index(doc, index_name, embed["dense_size"])
+                    await self._setup_collections(doc)
+                    index_checked = True
+                self.qdrant.upload_points(
+                    collection_name=index_name,
+                    points=points,
+                    batch_size=self.batch_size,
+                    parallel=self.parallel,
+                )
+            except Exception as e:
+                raise exceptions.IndexUploadException(
+                    f"Failed to upload points for document {doc.id}: {e}"
+                )
+        if not index_checked:
+            return
+        # record the document only once all of its chunks are uploaded
         try:
-            await self._check_index(doc, index_name, embed["dense_size"])
-            await self._setup_collections(doc)
-            self.qdrant.upload_points(
-                collection_name=index_name,
-                points=points,
-                batch_size=self.batch_size,
-                parallel=self.parallel,
-            )
+            self._upload_doc_metadata(doc)
         except Exception as e:
             raise exceptions.IndexUploadException(
-                f"Failed to upload points for document {doc.id}: {e}"
+                f"Failed to upload metadata for document {doc.id}: {e}"
             )
 
     async def list_index(self):
@@ -311,7 +327,7 @@ class QdrantIndexer(BaseIndexer):
         if not query_resp or not query_resp[0]:
             return None
 
-        doc = Document.model_validate(query_resp[0][0].payload)
+        doc = Document.model_construct(**query_resp[0][0].payload)
         if not return_chunks:
             return doc
         chunks = await self.qdrant.scroll(
@@ -322,7 +338,7 @@ class QdrantIndexer(BaseIndexer):
             limit=chunk_limit,
             offset=offset,
         )
-        doc.chunks = [Chunk.model_validate(chunk.payload) for chunk in chunks[0]]
+        doc.chunks = [Chunk.model_construct(**chunk.payload) for chunk in chunks[0]]
         return doc
 
     async def _get_docs(self):
@@ -330,7 +346,7 @@ class QdrantIndexer(BaseIndexer):
         scroll_resp = await self.qdrant.scroll(
             collection_name=self.doc_metadata_collection, limit=count.count
         )
-        return [Document.model_validate(point.payload) for point in scroll_resp[0]]
+        return [Document.model_construct(**point.payload) for point in scroll_resp[0]]
 
     async def get_retriever(self, **kwargs):
         return QdrantRetriever(indexer=self, **kwargs)
@@ -0,0 +1,93 @@
+import time
+from collections import OrderedDict
+from typing import Hashable
+
+import numpy as np
+from modelhub import AsyncModelhub
+
+
+class SemanticCache:
+    """In-memory cache of LLM responses keyed by prompt embedding.
+
+    A lookup hits when the cosine similarity to a cached prompt added under the same
+    `namespace` reaches `threshold`. Least recently used entries are evicted beyond
+    `max_size`, and entries expire after `ttl` seconds (never if `ttl` is None).
+    """
+
+    def __init__(
+        self,
+        client: AsyncModelhub,
+        embedding_model: str = "bge-m3",
+        threshold: float = 0.95,
+        max_size: int = 512,
+        ttl: float | None = 3600,
+    ):
+        self.client = client
+        self.embedding_model = embedding_model
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        # entry `slot` is row `slot` of `_vectors`, allocated on the first `add`
+        self._vectors: np.ndarray | None = None
+        self._created_at = np.zeros(max_size)
+        self._namespace_of_slot = np.full(max_size, -1, dtype=np.intp)
+        self._namespace_ids: dict[Hashable, int] = {}
+        self._entries: OrderedDict[int, str] = OrderedDict()
+        self._free_slots = list(range(max_size))
+
+    async def embed(self, text: str) -> np.ndarray:
+        embed_output = await self.client.get_embeddings([text], model=self.embedding_model)
+        vector = np.asarray(embed_output.embeddings[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _namespace_id(self, namespace: Hashable) -> int:
+        return self._namespace_ids.setdefault(namespace, len(self._namespace_ids))
+
+    def search(
+        self,
+        embedding: np.ndarray,
+        threshold: float | None = None,
+        *,
+        namespace: Hashable = None,
+    ) -> str | None:
+        threshold = self.threshold if threshold is None else threshold
+        if not self._entries:
+            return None
+        slots = np.fromiter(self._entries, dtype=np.intp, count=len(self._entries))
+        if self.ttl is not None:
+            expired = self._created_at[slots] < time.monotonic() - self.ttl
+            for slot in slots[expired].tolist():
+                del self._entries[slot]
+                self._free_slots.append(slot)
+            slots = slots[~expired]
+        slots = slots[self._namespace_of_slot[slots] == self._namespace_id(namespace)]
+        if not slots.size:
+            return None
+        # score every row in one matmul, rows of free slots are ignored
+        scores = (self._vectors @ embedding)[slots]
+        best = int(scores.argmax())
+        if scores[best] < threshold:
+            return None
+        slot = int(slots[best])
+        self._entries.move_to_end(slot)
+        return self._entries[slot]
+
+    def add(self, embedding: np.ndarray, response: str, *, namespace: Hashable = None):
+        if self.max_size <= 0:
+            return
+        if self._vectors is None:
+            self._vectors = np.zeros((self.max_size, len(embedding)), dtype=np.float32)
+        if self._free_slots:
+            slot = self._free_slots.pop()
+        else:
+            slot, _ = self._entries.popitem(last=False)
+        self._vectors[slot] = embedding
+        self._created_at[slot] = time.monotonic()
+        self._namespace_of_slot[slot] = self._namespace_id(namespace)
+        self._entries[slot] = response
+
+    def clear(self):
+        self._entries.clear()
+        self._namespace_ids.clear()
+        self._free_slots = list(range(self.max_size))
@@ -1,15 +1,21 @@
+from contextlib import aclosing, asynccontextmanager
+from contextvars import ContextVar
 from dataclasses import dataclass
-from typing import List, Literal, Optional, TypedDict, Union, Unpack
+from typing import List, Literal, Optional, Union
 
 import anyio
+import pydantic
+from anyio.abc import TaskGroup
 from loguru import logger
 from modelhub import AsyncModelhub
+from typing_extensions import TypedDict, Unpack
 
 from ..document.document import Chunk
+from ..llm.cache import SemanticCache
 from ..llm.message import Message
 
 
-@dataclass
+@dataclass(slots=True)
 class LLMCost:
     total_tokens: int = 0
     total_cost: float = 0.0
@@ -18,6 +24,16 @@ class LLMCost:
     output_tokens: int = 0
     output_cost: float = 0.0
 
+    def add(self, other: "LLMCost") -> "LLMCost":
+        """Accumulate `other` into this cost in place"""
+        self.total_tokens += other.total_tokens
+        self.total_cost += other.total_cost
+        self.input_tokens += other.input_tokens
+        self.input_cost += other.input_cost
+        self.output_tokens += other.output_tokens
+        self.output_cost += other.output_cost
+        return self
+
 
 class RAGState(TypedDict, total=False):
     query: str
@@ -26,18 +42,29 @@ class RAGState(TypedDict, total=False):
     history: Union[List[Message], str]
     chunks: List[Chunk]
     context: str
-    final_prompt: str
+    final_prompt: Union[str, List[dict]]
     response: str
+    delta: str
     cost: LLMCost
 
 
-@dataclass
+@dataclass(slots=True)
 class SharedResource:
     llm: AsyncModelhub
     listener: "TranformBatchListener"
+    dedup_requests: bool = False
+    semantic_cache: Optional[SemanticCache] = None
+
+
+_STATE_ADAPTER = pydantic.TypeAdapter(RAGState)
 
 
 class TransformListener:
+    @staticmethod
+    def dump_state(state: RAGState) -> bytes:
+        """Serialize a state to JSON, for listeners that log or ship states"""
+        return _STATE_ADAPTER.dump_json(state)
+
     async def on_transform_enter(self, transform: "BaseTransform", state: RAGState):
         pass
 
@@ -45,38 +72,94 @@ class TransformListener:
         pass
 
 
+_LISTENER_EVENTS = tuple(name for name in vars(TransformListener) if name.startswith("on_"))
+
+
+async def _noop(*args):
+    return
+
+
 class TranformBatchListener:
     def __init__(self, listeners: list[TransformListener]):
-        if listeners is None:
-            listeners = []
         self.listeners = listeners
 
+    @property
+    def listeners(self) -> tuple[TransformListener, ...]:
+        """read-only, assign or use `add_listener`/`remove_listener` to change listeners"""
+        return tuple(self._listeners)
+
+    @listeners.setter
+    def listeners(self, listeners: list[TransformListener] | None):
+        self._listeners = list(listeners or [])
+        self._bind_events()
+
+    def _bind_events(self):
+        # event handlers are rebuilt whenever listeners change, not on every event
+        for event in _LISTENER_EVENTS:
+            if not self._listeners:
+                setattr(self, event, _noop)
+            elif len(self._listeners) == 1:
+                # a single listener needs no task group
+                setattr(self, event, getattr(self._listeners[0], event))
+            else:
+                setattr(self, event, self._on_event_construct(event))
+
     def _on_event_construct(self, event: str):
         async def _on_event(*args):
-            if not self.listeners:
-                return
             async with anyio.create_task_group() as tg:
-                for listener in self.listeners:
-                    tg.start_soon(listener.__getattribute__(event), *args)
+                for listener in self._listeners:
+                    tg.start_soon(getattr(listener, event), *args)
 
         return _on_event
 
-    def __getattribute__(self, name: str):
-        if name.startswith("on_"):
-            return self._on_event_construct(name)
-        return super().__getattribute__(name)
-
     def add_listener(self, listener: TransformListener):
-        self.listeners.append(listener)
+        self._listeners.append(listener)
+        self._bind_events()
 
     def remove_listener(self, listener: TransformListener):
-        self.listeners.remove(listener)
+        self._listeners.remove(listener)
+        self._bind_events()
 
     def clear_listeners(self):
         self.listeners = []
 
 
+_STREAM_TASK_GROUP: ContextVar[TaskGroup | None] = ContextVar("_STREAM_TASK_GROUP", default=None)
+
+
+@asynccontextmanager
+async def _stream_task_group():
+    """Host parallel sub-streams in a task group owned by the caller of `open_stream`"""
+    async with anyio.create_task_group() as tg:
+        token = _STREAM_TASK_GROUP.set(tg)
+        try:
+            yield
+        finally:
+            _STREAM_TASK_GROUP.reset(token)
+
+
+async def _drain_stream(t: "BaseTransform", state: RAGState, send, cancel_scope):
+    with cancel_scope:
+        async with send, aclosing(t.stream(state)) as stream:
+            async for s in stream:
+                try:
+                    await send.send(s)
+                except anyio.BrokenResourceError:
+                    # the consumer stopped early
+                    return
+
+
+def _build_input_getter(input_key: Optional[Union[List[str], str]]):
+    if isinstance(input_key, list):
+        keys = tuple(input_key)
+        return lambda state: {k: state.get(k) for k in keys}
+    return lambda state: {input_key: state.get(input_key)}
+
+
 class BaseTransform:
+    stream_buffer_size: int = 8
+    """states buffered from parallel sub-streams before producers wait for the consumer"""
+
     def __init__(
         self,
         transforms: Optional[List["BaseTransform"]] = None,
@@ -93,6 +176,8 @@ class BaseTransform:
         self.input_key = input_key
         self.output_key = output_key
         self.shared = shared
+        # input_key is fixed at construction, resolve its shape once
+        self._input_getter = _build_input_getter(input_key)
 
         self._transforms = transforms
         self._run_in_parallel = run_in_parallel
@@ -100,13 +185,16 @@ class BaseTransform:
         if self._run_type == "ignore" and self._transforms is None:
             self._run_type = "after"
         self._inited = False
+        self._init_lock = anyio.Lock()
+        self._fused = None
 
     async def _init_sub_transforms(self):
-        _to_init = [v for v in self.__dict__.values() if isinstance(v, BaseTransform)]
-        if self._transforms is not None:
-            _to_init = _to_init + self._transforms
+        discovered = [v for v in self.__dict__.values() if isinstance(v, BaseTransform)]
+        to_init = discovered + (self._transforms or [])
+        if not to_init:
+            return
         async with anyio.create_task_group() as tg:
-            for t in _to_init:
+            for t in to_init:
                 t.name = f"{self.name}::{t.name}"
                 tg.start_soon(t._init, self.shared)
 
@@ -116,24 +204,52 @@ class BaseTransform:
     async def _init(self, shared: SharedResource | None = None):
         if self._inited:
             return
-        if self.shared is None and shared is None:
-            logger.warning(
-                f"SharedResource not provided for {self.name}, using default shared resource. This may cause unexpected behavior."
-            )
-            shared = self._default_sharedresource()
-        self.shared = shared or self.shared
-        await self._init_sub_transforms()
-        self._inited = True
+        async with self._init_lock:
+            # concurrent first calls wait here and find the transform inited
+            if self._inited:
+                return
+            if self.shared is None and shared is None:
+                logger.warning(
+                    f"SharedResource not provided for {self.name}, using default shared resource. This may cause unexpected behavior."
+                )
+                shared = self._default_sharedresource()
+            self.shared = shared or self.shared
+            await self._init_sub_transforms()
+            self._fused = self._compile()
+            self._inited = True
+
+    def _is_fusible(self) -> bool:
+        """leaf transform whose `__call__` only wraps `transform` with listener events"""
+        return (
+            not self._transforms
+            and self._run_type in ("before", "after")
+            and type(self).__call__ is BaseTransform.__call__
+        )
+
+    def _compile(self):
+        """Fuse sequential leaf sub-transforms into one coroutine calling `transform` directly"""
+        if self._run_in_parallel or not self._transforms:
+            return None
+        if not all(t._is_fusible() for t in self._transforms):
+            return None
+        steps = [t.transform for t in self._transforms]
+
+        async def _fused(state: RAGState) -> RAGState:
+            for step in steps:
+                state = await step(state)
+            return state
+
+        return _fused
 
     def _get_input(self, state: RAGState):
-        if isinstance(self.input_key, list):
-            return {k: state.get(k) for k in self.input_key}
-        else:
-            return {self.input_key: state.get(self.input_key)}
+        return self._input_getter(state)
 
     async def _run_sub_transforms(self, state: RAGState, *args):
         if self._transforms is None:
             return state
+        if self._fused is not None and not self.shared.listener.listeners:
+            # nothing observes the sub-transforms, skip their per-step `__call__`
+            return await self._fused(state)
         if self._run_in_parallel:
             async with anyio.create_task_group() as tg:
                 for t in self._transforms:
@@ -147,18 +263,34 @@ class BaseTransform:
         if self._transforms is None:
             return
         if self._run_in_parallel:
-            async with anyio.create_task_group() as tg:
-                for t in self._transforms:
-                    tg.start_soon(t.__call__, state, *args)
-            yield state
-            return
+            task_group = _STREAM_TASK_GROUP.get()
+            if task_group is None:
+                # a generator can't own a task group across yields, without one from
+                # `open_stream` the branches run to completion before yielding
+                yield await self._run_sub_transforms(state, *args)
+                return
+            send, receive = anyio.create_memory_object_stream(self.stream_buffer_size)
+            cancel_scopes = [anyio.CancelScope() for _ in self._transforms]
+            async with send:
+                for t, cancel_scope in zip(self._transforms, cancel_scopes):
+                    task_group.start_soon(_drain_stream, t, state, send.clone(), cancel_scope)
+            async with receive:
+                try:
+                    async for s in receive:
+                        yield s
+                finally:
+                    # stop the branches if the consumer stopped early
+                    for cancel_scope in cancel_scopes:
+                        cancel_scope.cancel()
         else:
             for t in self._transforms:
-                async for s in t.stream(state, *args):
-                    yield s
+                async with aclosing(t.stream(state, *args)) as stream:
+                    async for s in stream:
+                        yield s
 
     async def __call__(self, state: RAGState, **kwargs):
-        await self._init()
+        if not self._inited:
+            await self._init()
         listener = self.shared.listener
         await listener.on_transform_enter(self, state)
         if self._run_type == "before":
@@ -170,21 +302,34 @@ class BaseTransform:
         return state
 
     async def stream(self, state: RAGState, **kwargs):
-        await self._init()
+        if not self._inited:
+            await self._init()
         listener = self.shared.listener
 
         await listener.on_transform_enter(self, state)
         if self._run_type == "before":
             async for s in self.stream_transform(state, **kwargs):
                 yield s
-        async for s in self._run_sub_streams(state):
-            yield s
+        # close sub-streams in this task if the consumer stops early
+        async with aclosing(self._run_sub_streams(state)) as sub_streams:
+            async for s in sub_streams:
+                yield s
         if self._run_type == "after":
             async for s in self.stream_transform(state, **kwargs):
                 yield s
         await listener.on_transform_exit(self, state)
         return
 
+    @asynccontextmanager
+    async def open_stream(self, state: RAGState, **kwargs):
+        """Like `stream`, with parallel sub-transforms streaming concurrently.
+
+        The branches run in a task group owned by this context, so their errors are
+        raised when it exits.
+        """
+        async with _stream_task_group(), aclosing(self.stream(state, **kwargs)) as states:
+            yield states
+
     async def transform(self, state: RAGState, **kwargs) -> RAGState:
         return state
 
@@ -200,6 +345,8 @@ class BasePipeline(BaseTransform):
         output_key: str = "response",
         listeners: list[TransformListener] | None = None,
         llm: AsyncModelhub | None = None,
+        dedup_requests: bool = False,
+        semantic_cache: SemanticCache | None = None,
         *args,
         **kwargs,
     ):
@@ -210,7 +357,10 @@ class BasePipeline(BaseTransform):
             input_key=input_key,
             output_key=output_key,
             shared=SharedResource(
-                llm=llm or AsyncModelhub(), listener=TranformBatchListener(listeners)
+                llm=llm or AsyncModelhub(),
+                listener=TranformBatchListener(listeners),
+                dedup_requests=dedup_requests,
+                semantic_cache=semantic_cache,
             ),
             *args,
             **kwargs,
@@ -224,6 +374,11 @@ class BasePipeline(BaseTransform):
         async for state in super().stream(state=kwargs):
             yield state
 
+    @asynccontextmanager
+    async def open_stream(self, **kwargs: Unpack[RAGState]):
+        async with _stream_task_group(), aclosing(self.stream(**kwargs)) as states:
+            yield states
+
     async def transform(self, state: RAGState, return_state: bool = False, **kwargs) -> RAGState:
         return state if return_state else state.get(self.output_key)
 
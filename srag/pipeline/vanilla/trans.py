@@ -1,5 +1,8 @@
+import json
 from typing import Awaitable, Callable
 
+import anyio
+
 from srag.document import BaseReranker, BaseRetriever
 
 from ..pipeline import BaseTransform, Chunk, LLMCost, Message, RAGState
@@ -61,7 +64,25 @@ class PromptComposer(BaseTransform):
         return state
 
 
+class _PendingChat:
+    def __init__(self):
+        self.done = anyio.Event()
+        self.cancel_scope = anyio.CancelScope()
+        self.waiters = 0
+        self.finished = False
+        self.resp = None
+        self.error: Exception | None = None
+
+
 class Generation(BaseTransform):
+    """Generate the response for the prompt at `input_key`.
+
+    With `SharedResource.dedup_requests`, a call whose chat kwargs (prompt, model and
+    sampling parameters) match a request already in flight waits for that request and
+    gets the same response, so identical prompts share one completion even with a
+    sampling temperature. Only the call that made the request adds its tokens to the cost.
+    """
+
     def __init__(
         self,
         llm_model: str,
@@ -71,14 +92,16 @@ class Generation(BaseTransform):
         input_key: str = "final_prompt",
         output_key: str = "response",
         cost_key: str = "cost",
+        delta_key: str = "delta",
     ):
         super().__init__(input_key=input_key, output_key=output_key)
         self.llm_model = llm_model
         self.temperature = temperature
         self.top_p = top_p
         self.max_tokens = max_tokens
-        self.input_key = input_key
         self.cost_key = cost_key
+        self.delta_key = delta_key
+        self._in_flight: dict[str, _PendingChat] = {}
 
     def _prepare_chat_kwargs(self, state: RAGState):
         chat_kwargs = {
@@ -90,31 +113,66 @@ class Generation(BaseTransform):
         }
         return {k: v for k, v in chat_kwargs.items() if v is not None}
 
+    async def _chat(self, chat_kwargs: dict):
+        """Return the response and whether this call made the backend request"""
+        if not self.shared.dedup_requests:
+            return await self.shared.llm.chat(**chat_kwargs), True
+        key = json.dumps(chat_kwargs, sort_keys=True, default=str)
+        while (pending := self._in_flight.get(key)) is not None:
+            # while others wait on it, cancelling the first caller must not cancel the request
+            pending.waiters += 1
+            pending.cancel_scope.shield = True
+            try:
+                await pending.done.wait()
+            finally:
+                pending.waiters -= 1
+                if not pending.waiters:
+                    pending.cancel_scope.shield = False
+            if pending.finished:
+                if pending.error is not None:
+                    raise pending.error
+                return pending.resp, False
+            # the first caller was cancelled before anyone waited on it, request again
+        pending = self._in_flight[key] = _PendingChat()
+        try:
+            with pending.cancel_scope:
+                pending.resp = await self.shared.llm.chat(**chat_kwargs)
+            pending.finished = True
+        except Exception as e:
+            pending.error = e
+            pending.finished = True
+            raise
+        finally:
+            del self._in_flight[key]
+            pending.done.set()
+        return pending.resp, True
+
+    def _add_cost(self, state: RAGState, details):
+        i_tokens = details.prompt_tokens or 0
+        o_tokens = details.generated_tokens or 0
+        cost = LLMCost(
+            total_tokens=i_tokens + o_tokens, input_tokens=i_tokens, output_tokens=o_tokens
+        )
+        total = state.get(self.cost_key)
+        state[self.cost_key] = cost if total is None else total.add(cost)
+
     async def transform(self, state: RAGState, **kwargs) -> RAGState:
-        resp = await self.shared.llm.chat(**self._prepare_chat_kwargs(state))
+        resp, requested = await self._chat(self._prepare_chat_kwargs(state))
         state[self.output_key] = resp.generated_text
-        cost = state.get(self.cost_key, LLMCost())
-        i_tokens = resp.details.prompt_tokens or 0
-        o_tokens = resp.details.generated_tokens or 0
-        cost.input_tokens += i_tokens
-        cost.output_tokens += o_tokens
-        cost.total_tokens += i_tokens + o_tokens
-        state[self.cost_key] = cost
+        if requested:
+            self._add_cost(state, resp.details)
         return state
 
     async def stream_transform(self, state: RAGState, **kwargs):
         state[self.output_key] = ""
         async for token in self.shared.llm.stream_chat(**self._prepare_chat_kwargs(state)):
+            # the same state is yielded per token, `delta_key` holds just the new text
+            state[self.delta_key] = token.token.text
             state[self.output_key] += token.token.text
             if token.details.prompt_tokens or token.details.generated_tokens:
-                cost = state.get(self.cost_key, LLMCost())
-                i_tokens = token.details.prompt_tokens or 0
-                o_tokens = token.details.generated_tokens or 0
-                cost.input_tokens += i_tokens
-                cost.output_tokens += o_tokens
-                cost.total_tokens += i_tokens + o_tokens
-                state[self.cost_key] = cost
+                self._add_cost(state, token.details)
             yield state
+        state[self.delta_key] = ""
 
 
 class Retriever(BaseTransform):
@@ -1,3 +1,4 @@
+from .iterable import batched
 from .time import get_current_time_formatted
 
-__all__ = ["get_current_time_formatted"]
+__all__ = ["get_current_time_formatted", "batched"]
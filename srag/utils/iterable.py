@@ -0,0 +1,11 @@
+from itertools import islice
+from typing import Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+
+def batched(iterable: Iterable[T], n: int) -> Iterator[list[T]]:
+    """Yield lists of up to `n` items, like `itertools.batched` from Python 3.12"""
+    it = iter(iterable)
+    while batch := list(islice(it, n)):
+        yield batch
@@ -0,0 +1,108 @@
+import anyio
+import pytest
+from modelhub import AsyncModelhub
+
+from srag.pipeline.pipeline import BasePipeline, BaseTransform
+
+
+def _set_event() -> anyio.Event:
+    event = anyio.Event()
+    event.set()
+    return event
+
+
+class Gated(BaseTransform):
+    """Emits each value, or raises it if it is an exception, once its gate is set"""
+
+    def __init__(self, *steps: tuple[anyio.Event, str | Exception]):
+        super().__init__()
+        self.steps = steps
+        self.emitted = []
+
+    async def _step(self, gate: anyio.Event, value: str | Exception) -> str:
+        await gate.wait()
+        if isinstance(value, Exception):
+            raise value
+        self.emitted.append(value)
+        return value
+
+    async def transform(self, state, **kwargs):
+        for gate, value in self.steps:
+            state.setdefault("out", []).append(await self._step(gate, value))
+        return state
+
+    async def stream_transform(self, state, **kwargs):
+        for gate, value in self.steps:
+            yield {"out": await self._step(gate, value)}
+
+
+def _parallel_pipeline(*branches: BaseTransform) -> BasePipeline:
+    group = BaseTransform(transforms=list(branches), run_in_parallel=True)
+    return BasePipeline(transforms=[group], llm=AsyncModelhub(host="http://localhost"))
+
+
+@pytest.mark.anyio
+async def test_open_stream_yields_branch_states_as_they_are_produced():
+    a1, a2, b1 = anyio.Event(), anyio.Event(), anyio.Event()
+    pipeline = _parallel_pipeline(Gated((a1, "a1"), (a2, "a2")), Gated((b1, "b1")))
+    with anyio.fail_after(5):
+        async with pipeline.open_stream(query="q") as states:
+            for gate, expected in [(a1, "a1"), (b1, "b1"), (a2, "a2")]:
+                gate.set()
+                assert (await anext(states))["out"] == expected
+
+
+@pytest.mark.anyio
+async def test_open_stream_raises_branch_error_while_consumer_waits():
+    fail = anyio.Event()
+    failing = Gated((fail, RuntimeError("boom")))
+    slow = Gated((_set_event(), "s1"), (anyio.Event(), "s2"))
+    pipeline = _parallel_pipeline(failing, slow)
+    with anyio.fail_after(5), pytest.raises(ExceptionGroup) as excinfo:
+        async with pipeline.open_stream(query="q") as states:
+            async for _ in states:
+                fail.set()
+                await anyio.sleep_forever()
+    assert [repr(e) for e in excinfo.value.exceptions] == [repr(RuntimeError("boom"))]
+    assert slow.emitted == ["s1"]
+
+
+@pytest.mark.anyio
+async def test_open_stream_surfaces_broken_resource_error_from_a_branch():
+    pipeline = _parallel_pipeline(Gated((_set_event(), anyio.BrokenResourceError())))
+    with anyio.fail_after(5), pytest.raises(ExceptionGroup) as excinfo:
+        async with pipeline.open_stream(query="q") as states:
+            async for _ in states:
+                pass
+    assert excinfo.group_contains(anyio.BrokenResourceError)
+
+
+@pytest.mark.anyio
+async def test_open_stream_consumer_stops_early():
+    fast = Gated((_set_event(), "f1"), (anyio.Event(), "f2"))
+    slow = Gated((anyio.Event(), "s1"))
+    pipeline = _parallel_pipeline(fast, slow)
+    with anyio.fail_after(5):
+        async with pipeline.open_stream(query="q") as states:
+            async for _ in states:
+                break
+    assert fast.emitted == ["f1"]
+    assert slow.emitted == []
+
+
+@pytest.mark.anyio
+async def test_stream_without_task_group_runs_parallel_branches_to_completion():
+    pipeline = _parallel_pipeline(Gated((_set_event(), "a")), Gated((_set_event(), "b")))
+    with anyio.fail_after(5):
+        states = [s async for s in pipeline.stream(query="q")]
+    assert sorted(states[0]["out"]) == ["a", "b"]
+
+
+@pytest.mark.anyio
+async def test_stream_without_task_group_raises_branch_error():
+    failing = Gated((_set_event(), RuntimeError("boom")))
+    pipeline = _parallel_pipeline(Gated((anyio.Event(), "a")), failing)
+    with anyio.fail_after(5), pytest.raises(ExceptionGroup) as excinfo:
+        async for _ in pipeline.stream(query="q"):
+            pass
+    assert [repr(e) for e in excinfo.value.exceptions] == [repr(RuntimeError("boom"))]